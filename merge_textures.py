@@ -11,61 +11,52 @@ import traceback
 import time
 import platform
 import psutil
-import math
+import PIL
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 from PIL import Image
 
-# ====== 自动适配路径分隔符 ======
-tools_dir = Path(__file__).parent / "tools"
+# ====== 重采样参数 ======
+RESAMPLE_FILTER = Image.LANCZOS  # 可替换为 Image.BICUBIC / Image.BOX
+DRAFT_FORMATS = {'JPEG', 'MPO'}  # 支持解码时预缩小的格式
 
 # ====== 路径初始化 ======
 if getattr(sys, 'frozen', False):
     base_path = Path(sys._MEIPASS)
-    tools_dir = base_path / 'tools'
 else:
     base_path = Path(__file__).parent
-    tools_dir = base_path / 'tools'
-
-def get_tool(name):
-    """修复后的工具路径获取"""
-    if getattr(sys, 'frozen', False):
-        base_dir = Path(sys._MEIPASS)
-    else:
-        base_dir = Path(__file__).parent
-
-    tool_map = {
-        'texassemble': base_dir / 'tools' / ('texassemble.exe' if os.name == 'nt' else 'texassemble')
-    }
-    if not tool_map[name].exists():
-        raise FileNotFoundError(f"找不到{name}工具")
-    return tool_map[name]
+tools_dir = base_path / 'tools'
+
+# 工具路径在导入时解析一次，之后直接查表
+_EXE_SUFFIX = '.exe' if os.name == 'nt' else ''
+_TOOLS = {
+    name: (tools_dir / f"{name}{_EXE_SUFFIX}").resolve()
+    for name in ('texassemble', 'texconv', 'nvtt_export')
+}
+
+
+def _available_cpus():
+    """当前进程可用的CPU数（POSIX下遵循 taskset/cgroup 限制）"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
 
 # ====== 核心配置类 ======
 class Config:
-    @staticmethod
-    def get_tool(name):
-        # 添加编译时路径断言
-        assert (tools_dir / "texassemble.exe").exists(), "编译时工具路径校验失败"
     INPUT_DIR = Path("Input").resolve()
     OUTPUT_DIR = Path("Output").resolve()
     TEMP_DIR = Path(tempfile.gettempdir()).resolve()
+    # 仅有 p0 时的mip链来源：False 交给压缩工具直接生成；True 保留Python逐级处理（内存中逐级缩小）
+    USE_SOURCE_MIPS_ONLY = False
+    BC_ENCODER = 'texconv'  # 'texconv' | 'nvtt'（NVIDIA Texture Tools，CUDA压缩）
 
     @staticmethod
     def get_tool(name):
-        """跨平台工具路径解析"""
-        tool_map = {
-            'texassemble': {
-                'Windows': 'texassemble.exe',
-                'Linux': 'texassemble'
-            },
-            'texconv': {
-                'Windows': 'texconv.exe',
-                'Linux': 'texconv'
-            }
-        }
-        tool_path = tools_dir / tool_map[name][platform.system()]
-        return tool_path.resolve()
+        """跨平台工具路径解析（使用导入时缓存的结果）"""
+        return _TOOLS[name]
 
 
 # ====== 硬件管理模块 ======
@@ -75,104 +66,27 @@ class HardwareManager:
         """增强型资源检查v11"""
         checks = {
             'memory': psutil.virtual_memory().available > 1 * 1024 * 1024 * 1024,
-            'disk': psutil.disk_usage('/').free > 2 * 1024 * 1024 * 1024
+            'disk': psutil.disk_usage(str(Config.TEMP_DIR)).free > 2 * 1024 * 1024 * 1024
         }
         if not all(checks.values()):
             raise RuntimeError(f"资源不足: {', '.join(k for k, v in checks.items() if not v)}")
 
 
-# ====== 修复版分块处理器 ======
+# ====== 缩放处理器 ======
 class ChunkProcessor:
     @staticmethod
     def safe_resize(img, target_size):
-        """内存安全的图像缩放（v11修复块状问题）"""
-        try:
-            HardwareManager.check_resources()
-
-            # 动态分块策略
-            base_size = img.width * img.height * 3  # 原始像素数据量
-            mem_factor = psutil.virtual_memory().available / (base_size * 2)
-            chunk_size = max(256, min(2048, int(math.sqrt(mem_factor)) * 128))
-
-            # 生成有序分块坐标 (从左到右，从上到下)
-            tiles = [
-                (x, y, min(x + chunk_size, img.width), min(y + chunk_size, img.height))
-                for y in range(0, img.height, chunk_size)
-                for x in range(0, img.width, chunk_size)
-            ]
-
-            scale_w = target_size[0] / img.width
-            scale_h = target_size[1] / img.height
-
-            processed = []
-            for tile in tqdm(tiles, desc="处理分块", unit="tile"):
-                # 分块处理
-                cropped = img.crop(tile)
-                scaled = cropped.resize((
-                    max(1, int(cropped.width * scale_w)),
-                    max(1, int(cropped.height * scale_h))
-                ), Image.LANCZOS)
-
-                # 内存保护机制
-                if psutil.virtual_memory().percent > 85:
-                    processed = processed[-3:]  # 保留最近3个分块
-                    cropped.close()
-                    scaled.close()
-                    import gc;
-                    gc.collect()
-
-                processed.append(scaled)
-
-            return ChunkProcessor.merge(processed, target_size)
-        except Exception as e:
-            print(f"🛑 分块处理失败：{str(e)}")
-            return img.resize(target_size, Image.LANCZOS)
-
-    @staticmethod
-    def merge(tiles, target_size):
-        """v11修复的拼接算法"""
-        merged = Image.new('RGB', target_size)
-        x_pos, y_pos = 0, 0
-        current_row_height = 0
-
-        for tile in tiles:
-            # 换行检测
-            if x_pos + tile.width > merged.width:
-                x_pos = 0
-                y_pos += current_row_height
-                current_row_height = 0
-
-            # 越界终止
-            if y_pos >= merged.height:
-                break
-
-            # 精确坐标计算
-            paste_box = (
-                x_pos,
-                y_pos,
-                min(x_pos + tile.width, merged.width),
-                min(y_pos + tile.height, merged.height)
-            )
-
-            # 执行拼接
-            try:
-                merged.paste(tile.resize(
-                    (paste_box[2] - paste_box[0], paste_box[3] - paste_box[1]),
-                    Image.LANCZOS
-                ), paste_box)
-            except ValueError as e:
-                print(f"⚠ 跳过异常区块：{str(e)}")
-                continue
-
-            # 更新坐标
-            x_pos += tile.width
-            current_row_height = max(current_row_height, tile.height)
-
-            # 行末换行后检测
-            if y_pos + current_row_height > merged.height:
-                break
+        """内存安全的图像缩放（整图单次重采样，无分块接缝）"""
+        # 内存不足时退化为整数倍盒式缩小（mip链每级均为2倍缩小）
+        if psutil.virtual_memory().available < img.width * img.height * 4 * 3:
+            factor = (max(1, img.width // max(1, target_size[0])),
+                      max(1, img.height // max(1, target_size[1])))
+            if (img.width // factor[0], img.height // factor[1]) == tuple(target_size):
+                box = (0, 0, target_size[0] * factor[0], target_size[1] * factor[1])
+                return img.reduce(factor, box)
 
-        return merged
+        # reducing_gap 让 Pillow 先用 reduce() 预缩小再做精细重采样
+        return img.resize(target_size, RESAMPLE_FILTER, reducing_gap=2.0)
 
 
 # ====== 主处理流程 ======
@@ -182,28 +96,91 @@ class MipmapProcessor:
 
     def validate_environment(self):
         """增强环境校验"""
-        checks = [
-            (Config.INPUT_DIR.exists(), f"输入目录不存在：{Config.INPUT_DIR}"),
-            (Config.get_tool('texassemble').exists(), "找不到 texassemble 工具"),
-            (Config.get_tool('texconv').exists(), "找不到 texconv 工具")
-        ]
-        for condition, message in checks:
-            if not condition:
-                raise FileNotFoundError(message)
+        if not Config.INPUT_DIR.exists():
+            raise FileNotFoundError(f"输入目录不存在：{Config.INPUT_DIR}")
+        self._validate_tools()
+        if Config.BC_ENCODER not in ('texconv', 'nvtt'):
+            raise ValueError(f"未知的 BC_ENCODER：{Config.BC_ENCODER}（可选 texconv / nvtt）")
+
+        # Pillow-SIMD 的版本号带 .post 后缀，其重采样内核使用 SSE4/AVX2 加速
+        # 打包版 exe 的用户无法自行更换依赖，仅在源码运行时提示
+        if not getattr(sys, 'frozen', False) and '.post' not in PIL.__version__:
+            print("⚠ 未检测到 Pillow-SIMD，缩放将使用标量实现（pip install pillow-simd 可加速）")
+
+    @staticmethod
+    def _validate_tools():
+        """工具校验：os.access 一次调用同时检查存在性与可执行权限"""
+        for name in ('texassemble', 'texconv'):
+            if not os.access(Config.get_tool(name), os.X_OK):
+                raise FileNotFoundError(f"找不到 {name} 工具或没有执行权限")
 
     def process(self):
         """主处理流程（v11）"""
         files = self.get_mip_files()
-        base_size = Image.open(files[0]).size
         processed = [files[0]]
 
-        with tqdm(total=len(files) * 2, desc="处理进度") as pbar:
-            current_size = base_size
-            for idx in range(1, len(files)):
-                current_size = (current_size[0] // 2, current_size[1] // 2)
-                output = self.process_image(files[idx], current_size)
-                processed.append(output)
-                pbar.update(2)
+        # 资源检查为提示性质，整个流程只做一次
+        try:
+            HardwareManager.check_resources()
+        except RuntimeError as e:
+            print(f"⚠ {str(e)}")
+
+        # nvtt 会从顶层重新生成mip链，只适用于由压缩工具生成mip链的 p0 单图输入
+        if Config.BC_ENCODER == 'nvtt':
+            if len(files) > 1:
+                print("⚠ nvtt 仅用于只提供 p0 的输入，自定义各级mip仍使用 texconv 压缩")
+            elif Config.USE_SOURCE_MIPS_ONLY:
+                print("⚠ USE_SOURCE_MIPS_ONLY 已开启，mip链由本工具生成，nvtt 不适用，改用 texconv 压缩")
+
+        # 只提供 p0 且要求自行处理各级mip时，在内存中逐级缩小生成完整mip链
+        if len(files) == 1 and Config.USE_SOURCE_MIPS_ONLY:
+            with tqdm(total=2, desc="处理进度", mininterval=0.5) as pbar:
+                processed = self.build_mip_chain(files[0])
+                pbar.update(1)
+                self.generate_dds(processed)
+                pbar.update(1)
+            print(f"\n✅ 处理完成！输出目录：{Config.OUTPUT_DIR}")
+            return
+
+        # 只提供 p0 时跳过整个Python缩放流程，由压缩工具直接生成mip链
+        if len(files) == 1:
+            with tqdm(total=1, desc="处理进度", mininterval=0.5) as pbar:
+                self.generate_dds(processed)
+                pbar.update(1)
+            print(f"\n✅ 处理完成！输出目录：{Config.OUTPUT_DIR}")
+            return
+
+        with Image.open(files[0]) as im:
+            base_size = im.size
+
+        # 先在主进程读取文件头，尺寸已符合的层级直接使用原文件
+        processed += files[1:]
+        tasks = []
+        for i in range(1, len(files)):
+            target_size = (base_size[0] >> i, base_size[1] >> i)
+            with Image.open(files[i]) as im:
+                if im.size != target_size:
+                    tasks.append((i, target_size))
+
+        with tqdm(total=len(files) * 2, desc="处理进度", mininterval=0.5) as pbar:
+            pbar.update(2 * (len(files) - 1 - len(tasks)))
+
+            # 至少两级需要重采样时才启动进程池，否则在主进程内直接处理
+            executor = None
+            if len(tasks) >= 2:
+                executor = ProcessPoolExecutor(max_workers=min(len(tasks), _available_cpus()))
+            mapper = executor.map if executor else map
+            try:
+                # map 按提交顺序返回，保持mip级别顺序
+                outputs = mapper(self.process_image,
+                                 [files[i] for i, _ in tasks],
+                                 [size for _, size in tasks])
+                for (i, _), output in zip(tasks, outputs):
+                    processed[i] = output
+                    pbar.update(2)
+            finally:
+                if executor:
+                    executor.shutdown()
 
             self.generate_dds(processed)
             pbar.update(1)
@@ -214,14 +191,34 @@ class MipmapProcessor:
         """获取有序mipmap文件"""
         files = sorted(Config.INPUT_DIR.glob("p*.png"),
                        key=lambda x: int(x.stem[1:]))
-        if len(files) < 2:
-            raise FileNotFoundError("至少需要 p0.png 和 p1.png")
+        if not files:
+            raise FileNotFoundError("至少需要 p0.png")
         return files
 
-    def process_image(self, path, target_size):
+    @staticmethod
+    def build_mip_chain(path):
+        """由单张 p0 生成完整mip链（每级由上一级缩小，源图只解码一次）"""
+        with Image.open(path) as img:
+            current = img.convert('RGB')
+        outputs = [path]
+        level = 1
+        while current.size != (1, 1):
+            w, h = current.size
+            target_size = (max(1, w // 2), max(1, h // 2))
+            factor = (2 if w > 1 else 1, 2 if h > 1 else 1)
+            current = current.reduce(factor, (0, 0, target_size[0] * factor[0], target_size[1] * factor[1]))
+            temp_path = Config.TEMP_DIR / f"temp_p{level}.tga"
+            current.save(temp_path)
+            outputs.append(temp_path)
+            level += 1
+        return outputs
+
+    @staticmethod
+    def process_image(path, target_size):
         """图像处理（增加尺寸校验）"""
-        img = Image.open(path).convert('RGB')
+        img = Image.open(path)
         if img.size == target_size:
+            img.close()
             return path
 
         # 尺寸预校验
@@ -229,13 +226,51 @@ class MipmapProcessor:
                 target_size[1] != img.size[1] // 2):
             print(f"⚠ 尺寸校验警告：{path.name} 应为 {img.size[0] // 2}x{img.size[1] // 2}")
 
-        resized = ChunkProcessor.safe_resize(img, target_size)
-        temp_path = Config.TEMP_DIR / f"temp_{path.name}"
-        resized.save(temp_path, quality=95, optimize=True)
+        # JPEG 解码时直接按目标尺寸预缩小
+        if img.format in DRAFT_FORMATS:
+            img.draft('RGB', target_size)
+        img.load()
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        if target_size == (img.size[0] // 2, img.size[1] // 2):
+            # 标准2倍mip：盒式滤波，box裁掉奇数边避免尺寸向上取整
+            resized = img.reduce(2, (0, 0, target_size[0] * 2, target_size[1] * 2))
+        else:
+            resized = ChunkProcessor.safe_resize(img, target_size)
+        # 中间文件用未压缩TGA，省去 zlib 编码/解码（非Windows版 DirectXTex 不支持BMP）
+        temp_path = Config.TEMP_DIR / f"temp_{path.stem}.tga"
+        resized.save(temp_path)
         return temp_path
 
     def generate_dds(self, inputs):
         """DDS生成（增加格式校验）"""
+        final_output = Config.OUTPUT_DIR / "output.dds"
+
+        if len(inputs) == 1:
+            if Config.BC_ENCODER == 'nvtt':
+                nvtt = Config.get_tool('nvtt_export')
+                if os.access(nvtt, os.X_OK):
+                    # nvtt_export 默认生成完整mip链，并在GPU上完成BC3压缩
+                    subprocess.run([
+                        str(nvtt), str(inputs[0]),
+                        "--format", "bc3",
+                        "-o", str(final_output)
+                    ], check=True)
+                    return
+                print("⚠ 找不到 nvtt_export 工具，改用 texconv")
+
+            # 单张源图：texconv 一次完成完整mip链生成与BC3压缩，无需中间DDS
+            subprocess.run([
+                str(Config.get_tool('texconv')),
+                "-m", "0", "-f", "BC3_UNORM", "-y",
+                "-ft", "DDS", "-o", str(Config.OUTPUT_DIR),
+                str(inputs[0])
+            ], check=True)
+            # texconv 按源文件名输出，统一重命名为 output.dds
+            (Config.OUTPUT_DIR / f"{Path(inputs[0]).stem}.dds").replace(final_output)
+            return
+
         temp_dds = Config.TEMP_DIR / "❤️CL我喜欢你喵.dds"
 
         # texassemble 命令
@@ -246,18 +281,19 @@ class MipmapProcessor:
                        ] + [str(f) for f in inputs], check=True)
 
         # texconv 转换
-        final_output = Config.OUTPUT_DIR / "output.dds"
         subprocess.run([
             str(Config.get_tool('texconv')),
             "-f", "BC3_UNORM", "-y",
             "-ft", "DDS", "-o", str(Config.OUTPUT_DIR),
             str(temp_dds)
         ], check=True)
+        (Config.OUTPUT_DIR / temp_dds.name).replace(final_output)
 
         # 清理临时文件
         temp_dds.unlink(missing_ok=True)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后的exe需要此调用才能启动子进程
     try:
         Config.OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
         MipmapProcessor().process()
@@ -268,7 +304,7 @@ if __name__ == "__main__":
         系统: {platform.platform()}
         Python: {sys.version}
         内存使用: {psutil.virtual_memory().percent}%
-        磁盘空间: {psutil.disk_usage('/').free // (1024 * 1024)}MB 可用
+        磁盘空间: {psutil.disk_usage(str(Config.TEMP_DIR)).free // (1024 * 1024)}MB 可用
         当前路径: {Path.cwd()}
         输入文件: {len(list(Config.INPUT_DIR.glob('*')))} 个
         """
@@ -276,7 +312,7 @@ if __name__ == "__main__":
         traceback.print_exc()
     finally:
         # 清理所有临时文件
-        temp_files = list(Config.TEMP_DIR.glob("temp_*.png"))
+        temp_files = list(Config.TEMP_DIR.glob("temp_p*.tga"))
         for f in temp_files:
             try:
                 f.unlink()